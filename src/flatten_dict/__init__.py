@@ -1,7 +1,7 @@
-from .flatten_dict import flatten, unflatten  # noqa: F401
+from .flatten_dict import flatten, flatten_many, unflatten  # noqa: F401
 
 
-__all__ = ["flatten", "unflatten", "splitter"]
+__all__ = ["flatten", "flatten_many", "unflatten", "splitter"]
 
 try:
     # for Python >= 3.8
@@ -1,11 +1,9 @@
+import functools
 import inspect
-
-try:
-    from collections.abc import Mapping
-except ImportError:
-    from collections import Mapping
-
-import six
+import itertools
+import operator
+import os.path
+from collections.abc import Mapping
 
 from .reducers import tuple_reducer, path_reducer, dot_reducer, underscore_reducer
 from .splitters import tuple_splitter, path_splitter, dot_splitter, underscore_splitter
@@ -25,6 +23,9 @@ SPLITTER_DICT = {
     "underscore": underscore_splitter,
 }
 
+# common leaf types, which are never `Mapping`
+SCALAR_TYPES = frozenset([str, bytes, int, float, bool, type(None)])
+
 
 def flatten(
     d,
@@ -70,7 +71,12 @@ def flatten(
     flat_dict : dict
     """
     enumerate_types = tuple(enumerate_types)
-    flattenable_types = (Mapping,) + enumerate_types
+    keep_empty_types = tuple(keep_empty_types)
+    (
+        flattenable_types,
+        flattenable_exact_types,
+        leaf_exact_types,
+    ) = _get_flattenable_types(enumerate_types)
     if not isinstance(d, flattenable_types):
         raise ValueError(
             "argument type %s is not in the flattenalbe types %s"
@@ -83,48 +89,439 @@ def flatten(
 
     if isinstance(reducer, str):
         reducer = REDUCER_DICT[reducer]
-    try:
-        # Python 3
-        reducer_accepts_parent_obj = len(inspect.signature(reducer).parameters) == 3
-    except AttributeError:
-        # Python 2
-        reducer_accepts_parent_obj = len(inspect.getargspec(reducer)[0]) == 3
+    reducer_accepts_parent_obj = _reducer_accepts_parent_obj(reducer)
+    tuple_mode = reducer is tuple_reducer
+    delimiter = _get_reducer_delimiter(reducer)
+    path_mode = reducer is path_reducer
+    join_path = os.path.join
+    key_value_iterator = (
+        enumerate(d) if isinstance(d, enumerate_types) else iter(d.items())
+    )
+    if max_flatten_depth == 1:
+        return _flatten_one_level(
+            d, key_value_iterator, reducer, reducer_accepts_parent_obj, inverse
+        )
+    drop_empty_dicts = not issubclass(dict, keep_empty_types)
     flat_dict = {}
 
-    def _flatten(_d, depth, parent=None):
-        key_value_iterable = (
-            enumerate(_d) if isinstance(_d, enumerate_types) else six.viewitems(_d)
+    # Iterative depth-first traversal. The stack is kept as parallel lists of nodes,
+    # their key-value iterators and their flat keys, and the depth of the current node
+    # is the stack size. The frame of a node stays on the stack while its children are
+    # visited, so the output keeps the order of a recursive traversal.
+    # The key-value iterator is chosen once, when the frame is pushed.
+    nodes = [d]
+    # ids of the nodes on the stack, to detect values that contain themselves
+    node_ids = {id(d)}
+    key_value_iterators = [key_value_iterator]
+    # In tuple mode the parent key of the root level is the empty tuple, so the key of
+    # every item is simply `parent + (key,)`. The key tuple of a node is also the
+    # parent key of its children, so it is built only once.
+    parents = [() if tuple_mode else None]
+    is_new_frame = True
+    while nodes:
+        _d = nodes[-1]
+        key_value_iterator = key_value_iterators[-1]
+        parent = parents[-1]
+        depth = len(nodes)
+        can_go_deeper = max_flatten_depth is None or depth < max_flatten_depth
+        # a frame that is visited again has already yielded the child we came back from
+        has_item = not is_new_frame
+        # join the parent key once per level instead of once per key
+        key_prefix = (
+            "{}{}".format(parent, delimiter)
+            if delimiter is not None and parent is not None
+            else None
         )
-        has_item = False
-        for key, value in key_value_iterable:
+        # leaves of this level are collected and added to `flat_dict` in one batch
+        flat_items = []
+        for key, value in key_value_iterator:
             has_item = True
-            if reducer_accepts_parent_obj:
+            if tuple_mode:
+                # inline `tuple_reducer` to save a function call per key
+                flat_key = parent + (key,)
+            elif delimiter is not None:
+                # inline the delimiter reducers; keys in the root level are unchanged
+                flat_key = key if parent is None else key_prefix + format(key)
+            elif path_mode:
+                # inline `path_reducer`
+                flat_key = key if parent is None else join_path(parent, key)
+            elif reducer_accepts_parent_obj:
                 flat_key = reducer(parent, key, _d)
             else:
                 flat_key = reducer(parent, key)
-            if isinstance(value, flattenable_types) and (
-                max_flatten_depth is None or depth < max_flatten_depth
+            value_type = type(value)
+            if can_go_deeper and (
+                value_type in flattenable_exact_types
+                or value_type not in leaf_exact_types
+                and isinstance(value, flattenable_types)
             ):
-                # recursively build the result
-                has_child = _flatten(value, depth=depth + 1, parent=flat_key)
-                if has_child or not isinstance(value, keep_empty_types):
-                    # ignore the key in this level because it already has child key
-                    # or its value is empty
+                if drop_empty_dicts and value_type is dict and not value:
+                    # the size of a plain dict is known, so an empty one that would be
+                    # dropped is skipped instead of visited
                     continue
+                # visit the child before the rest of the items in this level
+                _add_node_id(node_ids, value, flat_key)
+                nodes.append(value)
+                key_value_iterators.append(
+                    enumerate(value)
+                    if isinstance(value, enumerate_types)
+                    else iter(value.items())
+                )
+                parents.append(flat_key)
+                is_new_frame = True
+                break
+
+            flat_items.append((value, flat_key) if inverse else (flat_key, value))
+        else:
+            node_ids.discard(id(nodes.pop()))
+            key_value_iterators.pop()
+            parents.pop()
+            is_new_frame = False
+            # the level is exhausted; an empty child is kept only if its type is in
+            # `keep_empty_types`, otherwise the key disappears
+            if not has_item and depth > 1 and isinstance(_d, keep_empty_types):
+                flat_items.append((_d, parent) if inverse else (parent, _d))
+        if flat_items:
+            _update_flat_dict(flat_dict, flat_items)
+
+    return flat_dict
+
 
-            # add an item to the result
-            if inverse:
-                flat_key, value = value, flat_key
-            if flat_key in flat_dict:
-                raise ValueError("duplicated key '{}'".format(flat_key))
-            flat_dict[flat_key] = value
+def _add_node_id(node_ids, node, flat_key):
+    """Add the id of `node` to `node_ids`, which are the ids of its ancestors."""
+    if id(node) in node_ids:
+        raise ValueError("circular reference found at key '{}'".format(flat_key))
+    node_ids.add(id(node))
 
-        return has_item
 
-    _flatten(d, depth=1)
+def _flatten_one_level(
+    d, key_value_iterator, reducer, reducer_accepts_parent_obj, inverse
+):
+    """Flatten `d` with ``max_flatten_depth=1``.
+
+    Nothing is flattened at this depth, so only the keys need to be reduced.
+    """
+    if reducer is tuple_reducer:
+        flat_items = [((key,), value) for key, value in key_value_iterator]
+    elif (
+        reducer is dot_reducer
+        or reducer is underscore_reducer
+        or reducer is path_reducer
+    ):
+        # these reducers keep the keys in the root level unchanged
+        flat_items = list(key_value_iterator)
+    elif reducer_accepts_parent_obj:
+        flat_items = [
+            (reducer(None, key, d), value) for key, value in key_value_iterator
+        ]
+    else:
+        flat_items = [(reducer(None, key), value) for key, value in key_value_iterator]
+    if inverse:
+        flat_items = [(value, flat_key) for flat_key, value in flat_items]
+    flat_dict = {}
+    _update_flat_dict(flat_dict, flat_items)
     return flat_dict
 
 
+@functools.lru_cache(maxsize=64)
+def _get_flattenable_types(enumerate_types):
+    """Return the types that `flatten` walks into, cached by `enumerate_types`.
+
+    The second and third items are `frozenset` of exact types that are known to be
+    flattenable and known to be leaves. Checking the exact type first skips the slow
+    `Mapping.__instancecheck__` for the common case of plain dicts and scalars.
+    """
+    flattenable_types = (Mapping,) + enumerate_types
+    flattenable_exact_types = frozenset((dict,) + enumerate_types)
+    leaf_exact_types = frozenset(
+        t for t in SCALAR_TYPES if not issubclass(t, flattenable_types)
+    )
+    return flattenable_types, flattenable_exact_types, leaf_exact_types
+
+
+def _get_reducer_delimiter(reducer):
+    """Return the delimiter of a reducer that `flatten` inlines, or None."""
+    if reducer is dot_reducer:
+        return "."
+    if reducer is underscore_reducer:
+        return "_"
+    return None
+
+
+def _reducer_accepts_parent_obj(reducer):
+    """Return whether `reducer` takes the parent object as its third argument."""
+    # the named reducers take two arguments, so `inspect.signature` is skipped for them
+    for named_reducer in REDUCER_DICT.values():
+        if reducer is named_reducer:
+            return False
+    return len(inspect.signature(reducer).parameters) == 3
+
+
+def _update_flat_dict(flat_dict, flat_items):
+    """Add `flat_items` to `flat_dict` and raise `ValueError` on a duplicated key."""
+    n_keys_before = len(flat_dict)
+    flat_dict.update(flat_items)
+    if len(flat_dict) - n_keys_before == len(flat_items):
+        return
+
+    # Some keys were duplicated. `dict.update` keeps the position of an existing key,
+    # so the first `n_keys_before` keys are the ones that existed before the update.
+    seen_keys = set(itertools.islice(flat_dict, n_keys_before))
+    for flat_key, _ in flat_items:
+        if flat_key in seen_keys:
+            raise ValueError("duplicated key '{}'".format(flat_key))
+        seen_keys.add(flat_key)
+
+
+def flatten_many(
+    records,
+    reducer="tuple",
+    inverse=False,
+    max_flatten_depth=None,
+    enumerate_types=(),
+    keep_empty_types=(),
+):
+    """Flatten dict-like objects that usually share the same structure.
+
+    The first record is flattened with `flatten`, and its flat keys are reused for the
+    other records, so the reducer is not called again for them. The values of another
+    record are read node by node with the keys of the first record, which is faster than
+    flattening it. This is meant for many records with the same keys, e.g., rows of a
+    JSON dataset.
+
+    A record with a missing or extra key, or with a value that would be flattened
+    differently (e.g., ``None`` in the first record and a dict in another one), is
+    flattened with `flatten` instead, so the result is always the same as calling
+    `flatten` for each record. So is every record if the reducer takes the parent object,
+    or if the types in `enumerate_types` do not support indexing (e.g., generators).
+
+    Parameters
+    ----------
+    records : Iterable[dict-like object]
+        The dicts that will be flattened.
+    reducer, inverse, max_flatten_depth, enumerate_types, keep_empty_types
+        See `flatten`.
+
+    Returns
+    -------
+    flat_dicts : List[dict]
+    """
+    if isinstance(reducer, str):
+        reducer = REDUCER_DICT[reducer]
+    flatten_kwargs = {
+        "inverse": inverse,
+        "max_flatten_depth": max_flatten_depth,
+        "enumerate_types": tuple(enumerate_types),
+        "keep_empty_types": tuple(keep_empty_types),
+    }
+    if _reducer_accepts_parent_obj(reducer):
+        # the flat keys may depend on the values, so they cannot be reused
+        return [
+            flatten(record, reducer=reducer, **flatten_kwargs) for record in records
+        ]
+
+    flat_dicts = []
+    for record in records:
+        if not flat_dicts:
+            flat_dict, flat_keys, read_record_values = _flatten_first_record(
+                record, reducer, flatten_kwargs
+            )
+            flat_dicts.append(flat_dict)
+            continue
+        values = None if read_record_values is None else read_record_values(record)
+        if values is None:
+            flat_dict = flatten(record, reducer=reducer, **flatten_kwargs)
+        elif inverse:
+            flat_dict = {}
+            _update_flat_dict(flat_dict, list(zip(values, flat_keys)))
+        else:
+            # the flat keys are unique, as the first record was flattened successfully
+            flat_dict = dict(zip(flat_keys, values))
+        flat_dicts.append(flat_dict)
+    return flat_dicts
+
+
+def _flatten_first_record(record, reducer, flatten_kwargs):
+    """Flatten the first record of `flatten_many`.
+
+    Returns
+    -------
+    flat_dict : dict
+        The same as the result of `flatten`.
+    flat_keys : list
+        The flat keys of `flat_dict` before inverting it.
+    read_record_values : Optional[Callable]
+        See `_get_record_reader`. None if `record` cannot be read by keys.
+    """
+    inverse = flatten_kwargs["inverse"]
+    max_flatten_depth = flatten_kwargs["max_flatten_depth"]
+    enumerate_types = flatten_kwargs["enumerate_types"]
+    keep_empty_types = flatten_kwargs["keep_empty_types"]
+    # the flat keys of the tuple reducer are the key paths, which every reducer shares
+    tuple_flat_dict = flatten(
+        record,
+        max_flatten_depth=max_flatten_depth,
+        enumerate_types=enumerate_types,
+        keep_empty_types=keep_empty_types,
+    )
+    key_paths = list(tuple_flat_dict)
+    if reducer is tuple_reducer:
+        flat_keys = key_paths
+    else:
+        flat_keys = _reduce_key_paths(key_paths, reducer)
+    values = tuple_flat_dict.values()
+    flat_dict = {}
+    _update_flat_dict(
+        flat_dict, list(zip(values, flat_keys) if inverse else zip(flat_keys, values))
+    )
+    try:
+        read_record_values = _get_record_reader(record, key_paths, flatten_kwargs)
+    except (KeyError, IndexError, TypeError):
+        read_record_values = None
+    return flat_dict, flat_keys, read_record_values
+
+
+def _reduce_key_paths(key_paths, reducer):
+    """Reduce `key_paths` to flat keys, calling `reducer` once per node like `flatten`."""
+    flat_keys_by_path = {}
+    flat_keys = []
+    for key_path in key_paths:
+        flat_key = None
+        for i in range(1, len(key_path) + 1):
+            node_path = key_path[:i]
+            if node_path in flat_keys_by_path:
+                flat_key = flat_keys_by_path[node_path]
+            else:
+                flat_key = flat_keys_by_path[node_path] = reducer(
+                    flat_key, node_path[-1]
+                )
+        flat_keys.append(flat_key)
+    return flat_keys
+
+
+def _get_record_reader(record, key_paths, flatten_kwargs):
+    """Return a function that reads the values of records shaped like `record`.
+
+    The nodes that `flatten` walks into and keeps some items of are listed in the order
+    they are visited, with their sizes and the keys of their children. The function
+    collects the children of each node into a list of slots, so every node is visited
+    once, and returns the values at the slots of `key_paths`, or None if a record does
+    not have the structure of `record`.
+    """
+    max_flatten_depth = flatten_kwargs["max_flatten_depth"]
+    enumerate_types = flatten_kwargs["enumerate_types"]
+    keep_empty_types = flatten_kwargs["keep_empty_types"]
+    (
+        flattenable_types,
+        flattenable_exact_types,
+        leaf_exact_types,
+    ) = _get_flattenable_types(enumerate_types)
+
+    # the root is always checked, even if none of its items are kept
+    node_paths = {()}
+    for key_path in key_paths:
+        node_paths.update(key_path[:i] for i in range(len(key_path)))
+    # the key paths of the slots; the children of a node get their slots when the node
+    # is reached, so this list grows while it is iterated
+    slot_paths = [()]
+    node_specs = []
+    for slot, node_path in enumerate(slot_paths):
+        if node_path not in node_paths:
+            continue
+        node = functools.reduce(operator.getitem, node_path, record)
+        node_keys = (
+            list(range(len(node))) if isinstance(node, enumerate_types) else list(node)
+        )
+        node_specs.append((slot, len(node), _get_items_getter(node_keys)))
+        slot_paths.extend(node_path + (key,) for key in node_keys)
+
+    slots_by_path = {key_path: slot for slot, key_path in enumerate(slot_paths)}
+    get_values = _get_items_getter([slots_by_path[key_path] for key_path in key_paths])
+    # values above `max_flatten_depth` are leaves only if they are not walked into
+    get_checked_values = _get_items_getter(
+        [
+            slots_by_path[key_path]
+            for key_path in key_paths
+            if max_flatten_depth is None or len(key_path) < max_flatten_depth
+        ]
+    )
+    leaf_paths = set(key_paths)
+    # the values that `flatten` walks into but drops, with their depths
+    dropped_slots = [
+        (slot, len(key_path))
+        for slot, key_path in enumerate(slot_paths)
+        if key_path not in node_paths and key_path not in leaf_paths
+    ]
+
+    def read_record_values(record):
+        slots = [record]
+        nodes = []
+        try:
+            for slot, size, get_children in node_specs:
+                node = slots[slot]
+                if (
+                    type(node) not in flattenable_exact_types
+                    and not isinstance(node, flattenable_types)
+                    or len(node) != size
+                ):
+                    return None
+                nodes.append(node)
+                # the size is the same, so the children have the same keys
+                slots.extend(get_children(node))
+            # a node that is reached twice may contain itself, which `flatten` raises
+            # `ValueError` for, so such a record is left to `flatten`
+            if len(set(map(id, nodes))) != len(nodes):
+                return None
+            checked_values = get_checked_values(slots)
+            if not leaf_exact_types.issuperset(map(type, checked_values)):
+                for value in checked_values:
+                    if isinstance(value, flattenable_types) and not (
+                        len(value) == 0 and isinstance(value, keep_empty_types)
+                    ):
+                        return None
+            for slot, depth in dropped_slots:
+                if not _is_dropped(slots[slot], depth, flatten_kwargs):
+                    return None
+        except (KeyError, IndexError, TypeError):
+            return None
+        return get_values(slots)
+
+    return read_record_values
+
+
+def _get_items_getter(keys):
+    """Return a function that gets the items at `keys` of an object as a tuple."""
+    if not keys:
+        return lambda obj: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda obj: (obj[key],)
+    return operator.itemgetter(*keys)
+
+
+def _is_dropped(value, depth, flatten_kwargs):
+    """Return whether `flatten` drops `value` at `depth` from the result."""
+    max_flatten_depth = flatten_kwargs["max_flatten_depth"]
+    enumerate_types = flatten_kwargs["enumerate_types"]
+    keep_empty_types = flatten_kwargs["keep_empty_types"]
+    flattenable_types, _, _ = _get_flattenable_types(enumerate_types)
+    if not isinstance(value, flattenable_types) or (
+        max_flatten_depth is not None and depth >= max_flatten_depth
+    ):
+        return False
+    if len(value) == 0:
+        return not isinstance(value, keep_empty_types)
+    # a non-empty value is dropped if all of its children are dropped
+    if max_flatten_depth is not None:
+        max_flatten_depth -= depth
+    return not flatten(
+        value,
+        max_flatten_depth=max_flatten_depth,
+        enumerate_types=enumerate_types,
+        keep_empty_types=keep_empty_types,
+    )
+
+
 def nested_set_dict(d, keys, value):
     """Set a value to a sequence of nested keys.
 
@@ -135,14 +532,12 @@ def nested_set_dict(d, keys, value):
     value : Any
     """
     assert keys
-    key = keys[0]
-    if len(keys) == 1:
-        if key in d:
-            raise ValueError("duplicated key '{}'".format(key))
-        d[key] = value
-        return
-    d = d.setdefault(key, {})
-    nested_set_dict(d, keys[1:], value)
+    for key in keys[:-1]:
+        d = d.setdefault(key, {})
+    key = keys[-1]
+    if key in d:
+        raise ValueError("duplicated key '{}'".format(key))
+    d[key] = value
 
 
 def unflatten(d, splitter="tuple", inverse=False):
@@ -170,7 +565,7 @@ def unflatten(d, splitter="tuple", inverse=False):
         splitter = SPLITTER_DICT[splitter]
 
     unflattened_dict = {}
-    for flat_key, value in six.viewitems(d):
+    for flat_key, value in d.items():
         if inverse:
             flat_key, value = value, flat_key
         key_tuple = splitter(flat_key)
@@ -1,13 +1,12 @@
-from __future__ import absolute_import
-
 import os.path
 import json
+import sys
+from collections.abc import Mapping, Sequence
 from types import GeneratorType
 
-import six
 import pytest
 
-from flatten_dict import flatten, unflatten
+from flatten_dict import flatten, flatten_many, unflatten
 from flatten_dict.reducers import (
     tuple_reducer,
     path_reducer,
@@ -106,16 +105,16 @@ def get_flat_tuple_dict(flat_tuple_dict):
 
 
 def get_flat_path_dict(flat_tuple_dict):
-    return {os.path.join(*k): v for k, v in six.viewitems(flat_tuple_dict)}
+    return {os.path.join(*k): v for k, v in flat_tuple_dict.items()}
 
 
 def get_flat_underscore_dict(flat_tuple_dict):
-    return {"_".join(k): v for k, v in six.viewitems(flat_tuple_dict)}
+    return {"_".join(k): v for k, v in flat_tuple_dict.items()}
 
 
 @pytest.fixture
 def inv_flat_tuple_dict(flat_tuple_dict):
-    return {v: k for k, v in six.viewitems(flat_tuple_dict)}
+    return {v: k for k, v in flat_tuple_dict.items()}
 
 
 def test_flatten_dict(normal_dict, flat_tuple_dict):
@@ -138,6 +137,37 @@ def test_flatten_dict_depth_limit_1(normal_dict):
     assert values_before == values_after
 
 
+@pytest.mark.parametrize(
+    "reducer, expected_flat_dict",
+    [
+        ("tuple", {("a",): "0", ("b",): {}, ("c",): {"a": "1"}}),
+        ("dot", {"a": "0", "b": {}, "c": {"a": "1"}}),
+        ("path", {"a": "0", "b": {}, "c": {"a": "1"}}),
+        (make_reducer("-"), {"a": "0", "b": {}, "c": {"a": "1"}}),
+        (
+            lambda k1, k2, parent: (k1, k2, len(parent)),
+            {
+                (None, "a", 3): "0",
+                (None, "b", 3): {},
+                (None, "c", 3): {"a": "1"},
+            },
+        ),
+    ],
+)
+def test_flatten_dict_depth_limit_1_with_reducer(reducer, expected_flat_dict):
+    d = {"a": "0", "b": {}, "c": {"a": "1"}}
+    assert flatten(d, reducer=reducer, max_flatten_depth=1) == expected_flat_dict
+
+
+def test_flatten_dict_depth_limit_1_inverse():
+    assert flatten({"a": "0", "b": "1"}, inverse=True, max_flatten_depth=1) == {
+        "0": ("a",),
+        "1": ("b",),
+    }
+    with pytest.raises(ValueError):
+        flatten({"a": "0", "b": "0"}, inverse=True, max_flatten_depth=1)
+
+
 def test_flatten_dict_depth_limit_2(normal_dict, flat_tuple_dict_depth2):
     assert flatten(normal_dict, max_flatten_depth=2) == flat_tuple_dict_depth2
 
@@ -146,6 +176,33 @@ def test_flatten_dict_irrelevant_depth_limit(normal_dict, flat_tuple_dict):
     assert flatten(normal_dict, max_flatten_depth=3) == flat_tuple_dict
 
 
+def test_flatten_dict_deeper_than_recursion_limit():
+    depth = sys.getrecursionlimit() + 10
+    deep_dict = value = {}
+    for _ in range(depth - 1):
+        value["a"] = value = {}
+    value["a"] = "0"
+    assert flatten(deep_dict) == {("a",) * depth: "0"}
+
+
+def test_flatten_dict_with_circular_reference():
+    d = {"x": 1}
+    d["self"] = d
+    with pytest.raises(ValueError, match="circular reference"):
+        flatten(d)
+
+
+def test_flatten_dict_with_str_enumerate_types():
+    # a one-character string enumerates to itself
+    with pytest.raises(ValueError, match="circular reference"):
+        flatten({"a": "x"}, enumerate_types=(str,))
+
+
+def test_flatten_dict_with_shared_value():
+    shared = {"b": "0"}
+    assert flatten({"a": shared, "c": shared}) == {("a", "b"): "0", ("c", "b"): "0"}
+
+
 def test_flatten_nonflattenable_type():
     with pytest.raises(ValueError):
         flatten([])
@@ -169,6 +226,31 @@ def test_flatten_dict_with_reducer(
     assert flatten(normal_dict, reducer=reducer) == expected_flat_dict
 
 
+@pytest.mark.parametrize("reducer", ["dot", "underscore", make_reducer(".")])
+def test_flatten_dict_with_non_str_keys_and_delimiter_reducer(reducer):
+    flat_dict = flatten({1: {2: "0", 3: {None: "1"}}, 4: "2"}, reducer=reducer)
+    delimiter = "_" if reducer == "underscore" else "."
+    assert flat_dict == {
+        "1{}2".format(delimiter): "0",
+        "1{0}3{0}None".format(delimiter): "1",
+        4: "2",
+    }
+
+
+class UnhashableReducer:
+    __hash__ = None
+
+    def __call__(self, k1, k2):
+        return k2 if k1 is None else "{}.{}".format(k1, k2)
+
+
+@pytest.mark.parametrize("max_flatten_depth", [None, 1])
+def test_flatten_dict_with_unhashable_reducer(normal_dict, max_flatten_depth):
+    assert flatten(
+        normal_dict, reducer=UnhashableReducer(), max_flatten_depth=max_flatten_depth
+    ) == flatten(normal_dict, reducer="dot", max_flatten_depth=max_flatten_depth)
+
+
 def test_flatten_dict_inverse(normal_dict, inv_flat_tuple_dict):
     assert flatten(normal_dict, inverse=True) == inv_flat_tuple_dict
 
@@ -180,6 +262,19 @@ def test_flatten_dict_inverse_with_duplicated_value(normal_dict):
         flatten(dup_val_dict, inverse=True)
 
 
+@pytest.mark.parametrize(
+    "d, inverse, duplicated_key",
+    [
+        ({"a": {"b": "0"}, "a.b": "1"}, False, "a.b"),
+        ({"a": "0", "b": {"a": "1", "b": "1"}}, True, "1"),
+        ({"a": "0", "b": {"a": "1"}, "c": "0"}, True, "0"),
+    ],
+)
+def test_flatten_dict_with_duplicated_key(d, inverse, duplicated_key):
+    with pytest.raises(ValueError, match="duplicated key '{}'".format(duplicated_key)):
+        flatten(d, reducer="dot", inverse=inverse)
+
+
 def test_flatten_dict_with_list_syntax(
     normal_dict_with_nested_lists, flat_dict_with_nested_lists_with_list_syntax
 ):
@@ -199,6 +294,113 @@ def test_flatten_dict_with_list_syntax(
     )
 
 
+@pytest.fixture
+def normal_dict_records(normal_dict):
+    records = []
+    for i in range(3):
+        record = json.loads(json.dumps(normal_dict))
+        record["c"]["b"]["b"] = ["3.{}".format(i), {}]
+        records.append(record)
+    return records
+
+
+@pytest.mark.parametrize("reducer", ["tuple", "dot", make_reducer("-")])
+@pytest.mark.parametrize("max_flatten_depth", [None, 1, 2])
+def test_flatten_many(normal_dict_records, reducer, max_flatten_depth):
+    kwargs = {
+        "reducer": reducer,
+        "max_flatten_depth": max_flatten_depth,
+        "enumerate_types": (list,),
+        "keep_empty_types": (dict,),
+    }
+    assert flatten_many(normal_dict_records, **kwargs) == [
+        flatten(record, **kwargs) for record in normal_dict_records
+    ]
+
+
+def test_flatten_many_inverse(normal_dict_records):
+    kwargs = {"reducer": "dot", "inverse": True, "enumerate_types": (list,)}
+    assert flatten_many(normal_dict_records, **kwargs) == [
+        flatten(record, **kwargs) for record in normal_dict_records
+    ]
+
+
+def test_flatten_many_with_generator(normal_dict_records):
+    assert flatten_many(iter(normal_dict_records)) == [
+        flatten(record) for record in normal_dict_records
+    ]
+    assert flatten_many([]) == []
+
+
+@pytest.mark.parametrize(
+    "records, kwargs",
+    [
+        # a null in the first record and an object in the next one
+        (
+            [{"addr": None, "id": 1}, {"addr": {"city": "x", "zip": "y"}, "id": 2}],
+            {"reducer": "dot"},
+        ),
+        # an empty list in the first record and a non-empty one in the next one
+        (
+            [{"tags": [], "id": 1}, {"tags": ["a", "b"], "id": 2}],
+            {"enumerate_types": (list,)},
+        ),
+        # a missing key
+        ([{"a": {"b": 1, "c": 2}}, {"a": {"b": 3}}], {}),
+        # an extra key
+        ([{"a": {"b": 1}}, {"a": {"b": 2, "c": 3}, "d": 4}], {}),
+        # a list shorter than in the first record
+        ([{"a": [1, 2]}, {"a": [3]}], {"enumerate_types": (list,)}),
+        # a dropped nested dict that is not empty in the next record
+        ([{"a": {"b": {}}, "c": 1}, {"a": {"b": {"d": 2}}, "c": 3}], {}),
+        # a kept empty dict that is not empty in the next record
+        ([{"a": {}}, {"a": {"b": 1}}], {"keep_empty_types": (dict,)}),
+        # a dict where the first record has a dict at the depth limit
+        (
+            [{"a": {"b": None}}, {"a": {"b": {"c": 1}}}],
+            {"max_flatten_depth": 2},
+        ),
+        # a scalar where the first record has a dict
+        ([{"a": {"b": 1}}, {"a": "b"}], {}),
+        # the same dict in two places of the next record
+        ([{"a": {"b": 1}, "c": {"b": 2}}, {"a": {"b": 3}, "c": {"b": 3}}], {}),
+    ],
+)
+def test_flatten_many_with_different_structures(records, kwargs):
+    assert flatten_many(records, **kwargs) == [
+        flatten(record, **kwargs) for record in records
+    ]
+
+
+def test_flatten_many_with_parent_obj_reducer():
+    def reducer(parent, key, obj):
+        return "{}[{}]".format(key, obj["type"])
+
+    records = [{"type": "A", "x": 1}, {"type": "B", "x": 2}]
+    assert flatten_many(records, reducer=reducer) == [
+        {"type[A]": "A", "x[A]": 1},
+        {"type[B]": "B", "x[B]": 2},
+    ]
+
+
+def test_flatten_many_with_generator_enumerate_types():
+    def make_records():
+        return [{"a": (i for i in range(n))} for n in (2, 3)]
+
+    kwargs = {"enumerate_types": (GeneratorType,)}
+    assert flatten_many(make_records(), **kwargs) == [
+        flatten(record, **kwargs) for record in make_records()
+    ]
+
+
+def test_flatten_many_with_circular_reference():
+    loop = {}
+    loop["a"] = loop
+    records = [{"a": {"a": {"a": 1}}}, {"a": loop}]
+    with pytest.raises(ValueError):
+        flatten_many(records, max_flatten_depth=3)
+
+
 def test_unflatten_dict(normal_dict, flat_tuple_dict):
     assert unflatten(flat_tuple_dict) == normal_dict
 
@@ -207,6 +409,14 @@ def test_unflatten_dict_inverse(normal_dict, inv_flat_tuple_dict):
     assert unflatten(inv_flat_tuple_dict, inverse=True) == normal_dict
 
 
+def test_unflatten_dict_deeper_than_recursion_limit():
+    depth = sys.getrecursionlimit() + 10
+    unflattened_dict = unflatten({("a",) * depth: "0"})
+    for _ in range(depth):
+        unflattened_dict = unflattened_dict["a"]
+    assert unflattened_dict == "0"
+
+
 @pytest.mark.parametrize(
     "splitter, flat_dict_func",
     [
@@ -446,10 +656,66 @@ def test_flatten_dict_with_empty_dict_kept(
     )
 
 
+class FalsyMapping(Mapping):
+    def __init__(self, d):
+        self._d = d
+
+    def __getitem__(self, key):
+        return self._d[key]
+
+    def __iter__(self):
+        return iter(self._d)
+
+    def __len__(self):
+        return len(self._d)
+
+    def __bool__(self):
+        return False
+
+
+def test_flatten_dict_with_falsy_mapping():
+    d = {"a": FalsyMapping({"b": "0"}), "c": FalsyMapping({}), "d": {}}
+    assert flatten(d) == {("a", "b"): "0"}
+    assert flatten(d, keep_empty_types=(FalsyMapping,)) == {
+        ("a", "b"): "0",
+        ("c",): d["c"],
+    }
+
+
 def test_flatten_dict_with_keep_empty_types(normal_dict, flat_tuple_dict):
     assert flatten(normal_dict, keep_empty_types=(dict, str)) == flat_tuple_dict
 
 
+def test_flatten_dict_with_scalar_enumerate_types():
+    d = {"a": b"xy", "b": 1}
+    assert flatten(d, enumerate_types=(bytes,)) == {
+        ("a", 0): b"x"[0],
+        ("a", 1): b"y"[0],
+        ("b",): 1,
+    }
+
+
+def test_flatten_dict_with_scalar_abc_enumerate_types():
+    assert flatten({"a": b"xy", "b": 1}, enumerate_types=(Sequence,)) == {
+        ("a", 0): b"x"[0],
+        ("a", 1): b"y"[0],
+        ("b",): 1,
+    }
+    # `bool` is a subclass of `int`, so it is not skipped as a leaf either
+    with pytest.raises(TypeError):
+        flatten({"a": True}, enumerate_types=(int,))
+
+
+def test_flatten_dict_with_type_lists():
+    d = {"a": [1, {}], "b": {}}
+    for _ in range(2):  # the second call uses the cached types
+        assert flatten(d, enumerate_types=[list], keep_empty_types=[dict]) == {
+            ("a", 0): 1,
+            ("a", 1): {},
+            ("b",): {},
+        }
+
+
 @pytest.mark.parametrize(
     "delimiter, delimiter_equivalent", [(".", "dot"), ("_", "underscore")]
 )